@@ -3,8 +3,9 @@
 
 from pathlib import Path
 import logging
-from typing import Dict, Any, List, Optional, Tuple, Set, Union, Callable
+from typing import Dict, Any, List, Optional, Tuple, Set, Union, Callable, Sequence, Iterator
 import json
+import orjson
 from urllib.parse import unquote_plus
 from io import BytesIO
 from operator import itemgetter
@@ -14,6 +15,20 @@ from .nodes import HostNode, URLNode
 from datetime import datetime, timedelta
 from functools import wraps
 
+# Feature set on the URL nodes loaded as an external ressource of an other node, by type of ressource
+_ressources_features = {
+    'img': 'image',
+    'script': 'js',
+    'video': 'video',
+    'audio': 'audio',
+    'iframe': 'iframe',
+    'embed': 'octet_stream',  # FIXME other icon?
+    'source': 'octet_stream',  # FIXME: Can be audio, video, or picture
+    # NOTE: the URL is probably not a CSS
+    # 'link': 'css',  # FIXME: Probably a css?
+    'object': 'octet_stream',  # FIXME: Same as embed, but more things
+}
+
 # Dev debug mode is a mode that will print lots of things and will only be usable
 # by someone with a pretty deep understanding of har2tree and how the tree is built
 # The goal is to have a relatively simple way to investigate the construction of a tree itself
@@ -51,9 +66,13 @@ def trace_make_subtree_fallback(method: Callable[..., None]) -> Callable[..., No
     return _impl
 
 
-def trace_make_subtree(method: Callable[..., None]) -> Callable[..., None]:
+# The sub trees to build from one level of the URL tree: (root of the sub tree, nodes to attach to it)
+_SubtreeSteps = Iterator[Tuple[URLNode, List[URLNode]]]
+
+
+def trace_make_subtree(method: Callable[..., _SubtreeSteps]) -> Callable[..., _SubtreeSteps]:
     @wraps(method)
-    def _impl(self: Any, root: URLNode, nodes_to_attach: Optional[List[URLNode]]=None, dev_debug: bool=False) -> None:
+    def _impl(self: Any, root: URLNode, nodes_to_attach: Optional[List[URLNode]]=None, dev_debug: bool=False) -> _SubtreeSteps:
         if dev_debug_mode:
             __load_debug_files()
             if dev_debug_url and root.name == dev_debug_url or nodes_to_attach is not None and any(True for u in nodes_to_attach if u.name == dev_debug_url):
@@ -79,6 +98,42 @@ def __load_debug_files() -> None:
             dev_debug_hostname = f.read().strip()
 
 
+# All the digits replaced by NUL, which can't be in a valid JSON document (it has to be escaped in the strings)
+_digits_to_nul = bytes.maketrans(b'0123456789', b'\x00' * 10)
+_big_integer_digits = b'\x00' * 19
+
+
+def _has_big_integers(content: bytes) -> bool:
+    """Check if the JSON document may contain integers orjson can't load as is (more than 64 bits)."""
+    masked = content.translate(_digits_to_nul)
+    start = masked.find(_big_integer_digits)
+    while start != -1:
+        end = start + len(_big_integer_digits)
+        while end < len(masked) and masked[end] == 0:
+            end += 1
+        # Only a number if it is a value: after a separator and before the end of the value,
+        # the long runs of digits in the strings (IDs in URLs, cookies, ...) are skipped.
+        before = content[max(0, start - 256):start].rstrip(b' \t\r\n-')[-1:]
+        after = content[end:end + 256].lstrip(b' \t\r\n')[:1]
+        if before and before in b':,[' and after and after in b',]}':
+            return True
+        start = masked.find(_big_integer_digits, end)
+    return False
+
+
+def _load_json_file(path: Path) -> Any:
+    """Load a JSON file with orjson, with a fallback on the standard library if orjson rejects it."""
+    content = path.read_bytes()
+    # NOTE: orjson silently loads the integers above 64 bits as floats, the standard library keeps them exact.
+    if not _has_big_integers(content):
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError:
+            # orjson is strict on unicode (lone surrogates are rejected), the standard library is more lenient.
+            pass
+    return json.loads(content)
+
+
 class HarFile():
 
     def __init__(self, harfile: Path, capture_uuid: str):
@@ -88,8 +143,7 @@ class HarFile():
         self.logger = Har2TreeLogAdapter(logger, {'uuid': self.capture_uuid})
         self.path = harfile
 
-        with self.path.open() as f:
-            self.har: Dict[str, Any] = json.load(f)
+        self.har: Dict[str, Any] = _load_json_file(self.path)
 
         # I mean it, that's the last URL the splash browser was on
         last_redirect_file = self.path.parent / f'{self.path.stem}.last_redirect.txt'
@@ -103,8 +157,7 @@ class HarFile():
 
         cookiefile = self.path.parent / f'{self.path.stem}.cookies.json'
         if cookiefile.is_file():
-            with cookiefile.open() as c:
-                self.cookies: List[Dict[str, Any]] = json.load(c)
+            self.cookies: List[Dict[str, Any]] = _load_json_file(cookiefile)
         else:
             self.logger.info('No cookies file available.')
             self.cookies = []
@@ -148,12 +201,12 @@ class HarFile():
             # Update 2020-04-01: .. but the fragment is not striped so self.final_redirect may not be found
             # Unless we find the entry in the har, we need to search again without the fragment
             if '#' in self.final_redirect:
-                self.final_redirect = self.final_redirect.split('#', 1)[0]
+                self.final_redirect = self.final_redirect.partition('#')[0]
                 self._search_final_redirect()
             elif '?' in self.final_redirect:
                 # At this point, we're trying things. The final URL returned by splash may have been changed
                 # in JavaScript and never appear in the HAR. Let's try to find the closest one with the same path
-                self.final_redirect = self.final_redirect.split('?', 1)[0]
+                self.final_redirect = self.final_redirect.partition('?')[0]
                 self._search_final_redirect()
             else:
                 self.logger.warning(f'Unable to find the final redirect: {self.final_redirect}')
@@ -217,17 +270,19 @@ class HarFile():
                     # <insert flip a table GIF>, yes, rebuilding a redirectURL is *fun*
                     # NOTE: Google HAR file doesn't have an 'url' key in the 'response' bloc.
                     full_redirect = rebuild_url(previous_entry['request']['url'],
-                                                previous_entry['response']['redirectURL'], [e['request']['url']])
+                                                previous_entry['response']['redirectURL'], {e['request']['url']})
                     if full_redirect == e['request']['url']:
                         to_return.append(e['request']['url'])
                         previous_entry = e
                     else:
                         continue
-                elif (self.__find_referer(e) and (self.__find_referer(e) == previous_entry['response']['url'])):
-                    to_return.append(e['request']['url'])
-                    previous_entry = e
                 else:
-                    continue
+                    referer = self.__find_referer(e)
+                    if referer and referer == previous_entry['response']['url']:
+                        to_return.append(e['request']['url'])
+                        previous_entry = e
+                    else:
+                        continue
 
                 if e['request']['url'] == self.final_redirect:
                     break
@@ -260,12 +315,20 @@ class Har2Tree(object):
         self.hostname_tree = HostNode(capture_uuid=self.har.capture_uuid)
 
         self._nodes_list: List[URLNode] = []
-        self.all_url_requests: Dict[str, List[URLNode]] = {unquote_plus(url_entry['request']['url']): [] for url_entry in self.har.entries}
+        # Format: node UUID: node, for all the nodes created from this capture
+        self._url_nodes_by_uuid: Dict[str, URLNode] = {}
+        self._host_nodes_by_uuid: Dict[str, HostNode] = {self.hostname_tree.uuid: self.hostname_tree}
+        self.all_url_requests: Dict[str, List[URLNode]] = {}
 
         # Format: pageref: node UUID
         self.pages_root: Dict[str, str] = {}
+        # Format: pageref: pageref of the last page before it with entries (see make_tree)
+        self._pages_before: Dict[str, str] = {}
+        # pageref used if the pageref of the node isn't in the list of pages
+        self._last_page_before: str = ''
 
-        self.all_redirects: List[str] = []
+        # Format: redirect URL: number of nodes redirecting to it
+        self.all_redirects: Dict[str, int] = defaultdict(int)
         self.all_referer: Dict[str, List[str]] = defaultdict(list)
         self.all_initiator_url: Dict[str, List[str]] = defaultdict(list)
         self._load_url_entries()
@@ -273,54 +336,54 @@ class Har2Tree(object):
         # Generate cookies lookup tables
         # All the initial cookies sent with the initial request given to splash
         self.initial_cookies: Dict[str, Dict[str, Any]] = {}
-        if hasattr(self._nodes_list[0], 'cookies_sent'):
+        if 'cookies_sent' in self._nodes_list[0].features:
             self.initial_cookies = {key: cookie for key, cookie in self._nodes_list[0].cookies_sent.items()}
 
         # Dictionary of all cookies received during the capture
         self.cookies_received: Dict[str, List[Tuple[str, URLNode, bool]]] = defaultdict(list)
-        for n in self._nodes_list:
-            if hasattr(n, 'cookies_received'):
-                for domain, c_received, is_3rd_party in n.cookies_received:
-                    self.cookies_received[c_received].append((domain, n, is_3rd_party))
-
         # Dictionary of all cookies sent during the capture
         self.cookies_sent: Dict[str, List[URLNode]] = defaultdict(list)
         for n in self._nodes_list:
-            if hasattr(n, 'cookies_sent'):
+            if 'cookies_received' in n.features:
+                for domain, c_received, is_3rd_party in n.cookies_received:
+                    self.cookies_received[c_received].append((domain, n, is_3rd_party))
+            if 'cookies_sent' in n.features:
                 for c_sent in n.cookies_sent.keys():
                     self.cookies_sent[c_sent].append(n)
 
         # NOTE: locally_created contains all cookies not present in a response, and not passed at the begining of the capture to splash
-        self.locally_created: Dict[str, Dict[str, Any]] = {}
-        for c in self.har.cookies:
-            c_identifier = f'{c["name"]}={c["value"]}'
-            if (c_identifier not in self.cookies_received
-                    and c_identifier not in self.initial_cookies):
-                self.locally_created[f'{c["name"]}={c["value"]}'] = c
+        self.locally_created: Dict[str, Dict[str, Any]] = {c_identifier: c for c in self.har.cookies
+                                                           if (c_identifier := f'{c["name"]}={c["value"]}') not in self.cookies_received
+                                                           and c_identifier not in self.initial_cookies}
 
         # NOTE: locally_created_not_sent only contains cookies that are created locally, and never sent during the capture
-        self.locally_created_not_sent: Dict[str, Dict[str, Any]] = self.locally_created.copy()
-        # Cross reference the source of the cookie
+        # self.cookies_sent already has all the cookies sent during the capture.
+        self.locally_created_not_sent: Dict[str, Dict[str, Any]] = {key: cookie for key, cookie in self.locally_created.items()
+                                                                    if key not in self.cookies_sent}
+        if self.locally_created_not_sent and self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(f'Cookies locally created & never sent {json.dumps(self.locally_created_not_sent, indent=2)}')
+
+        # NOTE: the lookup tables above must be complete before going through the nodes again.
         for n in self._nodes_list:
-            if hasattr(n, 'cookies_sent'):
-                for c_sent in n.cookies_sent:
-                    # Remove cookie from list if sent during the capture.
-                    self.locally_created_not_sent.pop(c_sent, None)
+            # Cross reference the source of the cookie
+            if 'cookies_sent' in n.features:
+                hostname = n.hostname
+                start_time = n.start_time
+                for c_sent, setters in n.cookies_sent.items():
                     for domain, setter_node, is_3rd_party in self.cookies_received[c_sent]:
                         # Make sure the cookie wasn't set by an other response from an other domain,
                         # and only add the entry in the list if the query setting the cookie started before the
                         # current one
-                        if n.hostname.endswith(domain) and setter_node.start_time < n.start_time:
+                        if hostname.endswith(domain) and setter_node.start_time < start_time:
                             # This cookie could have been set by this URL
-                            n.cookies_sent[c_sent].append({'setter': setter_node,
-                                                           '3rd_party': is_3rd_party})
-        if self.locally_created_not_sent:
-            self.logger.debug(f'Cookies locally created & never sent {json.dumps(self.locally_created_not_sent, indent=2)}')
+                            setters.append({'setter': setter_node, '3rd_party': is_3rd_party})
 
-        # Add context if urls are found in external_ressources
-        for n in self._nodes_list:
-            if hasattr(n, 'external_ressources'):
+            # Add context if urls are found in external_ressources
+            if 'external_ressources' in n.features:
                 for type_ressource, urls in n.external_ressources.items():
+                    feature = _ressources_features.get(type_ressource)
+                    if not feature:
+                        continue
                     for url in urls:
                         if url not in self.all_url_requests:
                             continue
@@ -328,35 +391,12 @@ class Har2Tree(object):
                             if node.empty_response:
                                 # If the body of the response was empty, skip.
                                 continue
-                            if type_ressource == 'img':
-                                node.add_feature('image', True)
-
-                            if type_ressource == 'script':
-                                node.add_feature('js', True)
-
-                            if type_ressource == 'video':
-                                node.add_feature('video', True)
-
-                            if type_ressource == 'audio':
-                                node.add_feature('audio', True)
-
-                            if type_ressource == 'iframe':
-                                node.add_feature('iframe', True)
-
-                            if type_ressource == 'embed':  # FIXME other icon?
-                                node.add_feature('octet_stream', True)
-
-                            if type_ressource == 'source':  # FIXME: Can be audio, video, or picture
-                                node.add_feature('octet_stream', True)
-
-                            # NOTE: the URL is probably not a CSS
-                            # if type_ressource == 'link':  # FIXME: Probably a css?
-                            #    node.add_feature('css', True)
-
-                            if type_ressource == 'object':  # FIXME: Same as embed, but more things
-                                node.add_feature('octet_stream', True)
+                            node.add_feature(feature, True)
 
         self.url_tree = self._nodes_list.pop(0)
+        # Nodes not attached to the tree yet. The list keeps the order for the fallback in make_tree,
+        # the set is used for the lookups while building the tree.
+        self._pending_nodes: Set[URLNode] = set(self._nodes_list)
 
     @property
     def total_load_time(self) -> timedelta:
@@ -364,7 +404,7 @@ class Har2Tree(object):
 
     @property
     def total_size_responses(self) -> int:
-        return sum(urlnode.body.getbuffer().nbytes for urlnode in self.url_tree.traverse() if not urlnode.empty_response)
+        return sum(urlnode.body_size for urlnode in self.url_tree.traverse() if not urlnode.empty_response)
 
     @property
     def stats(self) -> Dict[str, Any]:
@@ -426,20 +466,32 @@ class Har2Tree(object):
 
         got_final_redirect: bool = False
 
-        for i, url_entry in enumerate(self.har.entries):
-            n = URLNode(capture_uuid=self.har.capture_uuid, name=unquote_plus(url_entry['request']['url']))
+        # The same URLs are used as names, referers, initiators, and keys of the lookup tables:
+        # use a single string object for each of them, the dict lookups are then mostly identity checks.
+        urls: Dict[str, str] = {}
+        # NOTE: all the URLs of the capture must be known before loading the entries (redirects, external ressources)
+        names: List[str] = []
+        for url_entry in self.har.entries:
+            name = unquote_plus(url_entry['request']['url'])
+            names.append(urls.setdefault(name, name))
+            self.all_url_requests.setdefault(name, [])
+
+        all_requests = frozenset(self.all_url_requests)
+
+        for i, (url_entry, name) in enumerate(zip(self.har.entries, names)):
+            n = URLNode(capture_uuid=self.har.capture_uuid, name=name)
             if self.har.html_content and n.name == self.har.final_redirect and not got_final_redirect:
-                n.load_har_entry(url_entry, list(self.all_url_requests.keys()), self.har.html_content)
+                n.load_har_entry(url_entry, all_requests, self.har.html_content)
                 # NOTE 2021-05-28: only mark one node as final redirect
                 got_final_redirect = True
             else:
-                n.load_har_entry(url_entry, list(self.all_url_requests.keys()))
-            if hasattr(n, 'redirect_url'):
-                self.all_redirects.append(n.redirect_url)
+                n.load_har_entry(url_entry, all_requests)
+            if 'redirect_url' in n.features:
+                self.all_redirects[n.redirect_url] += 1
 
-            if hasattr(n, 'initiator_url'):
+            if 'initiator_url' in n.features:
                 # The HAR file was created by chrome/chromium and we got the _initiator key
-                self.all_initiator_url[n.initiator_url].append(n.name)
+                self.all_initiator_url[urls.setdefault(n.initiator_url, n.initiator_url)].append(n.name)
 
             if url_entry['startedDateTime'] in self.har.pages_start_times:
                 for page in self.har.pages_start_times[url_entry['startedDateTime']]:
@@ -449,12 +501,13 @@ class Har2Tree(object):
                         break
 
             # NOTE 2021-05-28: Ignore referer for first entry
-            if hasattr(n, 'referer') and i > 0:
+            if 'referer' in n.features and i > 0:
                 # NOTE 2021-05-14: referer to self are a real thing: url -> POST to self
                 if n.name != n.referer or ('method' in n.request and n.request['method'] == 'POST'):
-                    self.all_referer[n.referer].append(n.name)
+                    self.all_referer[urls.setdefault(n.referer, n.referer)].append(n.name)
 
             self._nodes_list.append(n)
+            self._url_nodes_by_uuid[n.uuid] = n
             self.all_url_requests[n.name].append(n)
 
         # So, sometimes, the startedDateTime in the page list is fucked up
@@ -470,10 +523,18 @@ class Har2Tree(object):
 
     def get_host_node_by_uuid(self, uuid: str) -> HostNode:
         """Returns the node with this UUID from the HostNode tree"""
+        node = self._host_nodes_by_uuid.get(uuid)
+        if node is not None and node.get_tree_root() is self.hostname_tree:
+            return node
+        # Not created by this capture, or not (or no longer) in the tree
         return self.hostname_tree.search_nodes(uuid=uuid)[0]
 
     def get_url_node_by_uuid(self, uuid: str) -> URLNode:
         """Returns the node with this UUID from the URLNode tree"""
+        node = self._url_nodes_by_uuid.get(uuid)
+        if node is not None and node.get_tree_root() is self.url_tree:
+            return node
+        # Not created by this capture (the trees joined by CrawledTree), or not attached to the tree
         return self.url_tree.search_nodes(uuid=uuid)[0]
 
     @property
@@ -500,36 +561,60 @@ class Har2Tree(object):
         """ Groups all the URLs by domain in the HostNode tree.
         `root_node_url` can be a list of nodes called by the same `root_node_hostname`
         """
-        if not isinstance(root_nodes_url, list):
-            root_nodes_url = [root_nodes_url]
-        for root_node_url in root_nodes_url:
-            children_hostnames: Dict[str, HostNode] = {}
-            sub_roots: Dict[HostNode, List[URLNode]] = defaultdict(list)
-            for child_node_url in root_node_url.get_children():
-                if child_node_url.hostname is None:
-                    self.logger.warning(f'Fucked up URL: {child_node_url}')
-                    continue
-                if child_node_url.hostname in children_hostnames:
-                    child_node_hostname = children_hostnames[child_node_url.hostname]
-                else:
-                    child_node_hostname = root_node_hostname.add_child(HostNode(capture_uuid=self.har.capture_uuid, name=child_node_url.hostname))
-                    children_hostnames[child_node_url.hostname] = child_node_hostname
-                child_node_hostname.add_url(child_node_url)
-                child_node_url.add_feature('hostnode_uuid', child_node_hostname.uuid)
-
-                if not child_node_url.is_leaf():
-                    sub_roots[child_node_hostname].append(child_node_url)
-            for child_node_hostname, child_nodes_url in sub_roots.items():
-                self.make_hostname_tree(child_nodes_url, child_node_hostname)
+        roots_url: Sequence[URLNode] = root_nodes_url if isinstance(root_nodes_url, list) else (root_nodes_url, )
+        capture_uuid = self.har.capture_uuid
+        # NOTE: iterative and not recursive, the trees can be deeper than the recursion limit.
+        # Each entry only adds children to its own host node, the order they're processed in doesn't matter.
+        to_process: List[Tuple[Sequence[URLNode], HostNode]] = [(roots_url, root_node_hostname)]
+        while to_process:
+            nodes_url, node_hostname = to_process.pop()
+            for node_url in nodes_url:
+                children_hostnames: Dict[str, HostNode] = {}
+                sub_roots: Dict[HostNode, List[URLNode]] = defaultdict(list)
+                # NOTE: get_children returns a copy of the list, we only need to iterate over it.
+                for child_node_url in node_url.children:
+                    hostname = child_node_url.hostname
+                    if hostname is None:
+                        self.logger.warning(f'Fucked up URL: {child_node_url}')
+                        continue
+                    child_node_hostname = children_hostnames.get(hostname)
+                    if child_node_hostname is None:
+                        child_node_hostname = node_hostname.add_child(HostNode(capture_uuid=capture_uuid, name=hostname))
+                        children_hostnames[hostname] = child_node_hostname
+                        self._host_nodes_by_uuid[child_node_hostname.uuid] = child_node_hostname
+                    child_node_hostname.add_url(child_node_url)
+                    child_node_url.add_feature('hostnode_uuid', child_node_hostname.uuid)
+
+                    if child_node_url.children:
+                        sub_roots[child_node_hostname].append(child_node_url)
+                to_process.extend((child_nodes_url, child_node_hostname) for child_node_hostname, child_nodes_url in sub_roots.items())
 
     def make_tree(self) -> URLNode:
         """Build URL and Host trees"""
         self._make_subtree(self.url_tree)
-        while self._nodes_list:
+        # The page before each page, to attach the nodes root of their pageref in _make_subtree_fallback.
+        # The pages and their roots do not change while building the tree, the mapping is built once.
+        pages = self.har.har['log']['pages']
+        if pages:
+            self._last_page_before = pages[0]['id']
+            for page in pages[1:]:
+                self._pages_before.setdefault(page['id'], self._last_page_before)
+                # Sometimes, the page listed in the list of pages is not related to
+                # any of the entries. Go figure what happened.
+                # If that's the case, we cannot use it as a reference
+                if page['id'] in self.pages_root:
+                    self._last_page_before = page['id']
+        # NOTE: the list is not modified while attaching the remaining nodes, go through it in order
+        #       and empty it afterwards, instead of popping its first element every time.
+        for node in self._nodes_list:
             # We were not able to attach a few things using the referers, redirects, or grepping on the page.
             # The remaining nodes are things we cannot attach for sure, so we try a few things, knowing it won't be perfect.
-            node = self._nodes_list.pop(0)
+            if node not in self._pending_nodes:
+                # Attached in the meantime
+                continue
+            self._pending_nodes.discard(node)
             self._make_subtree_fallback(node)
+        self._nodes_list.clear()
 
         # Initialize the hostname tree root
         self.hostname_tree.add_url(self.url_tree)
@@ -561,23 +646,29 @@ class Har2Tree(object):
             self._make_subtree(self.url_tree.search_nodes(name=self.root_after_redirect)[0], [node])
         else:
             # No luck, the node is root for this pageref, let's attach it to the prior page in the list, or the very first node (tree root)
-            page_before = self.har.har['log']['pages'][0]
-            for page in self.har.har['log']['pages'][1:]:
-                if page['id'] == node.pageref:
-                    break
-                # Sometimes, the page listed in the list of pages is not related to
-                # any of the entries. Go figure what happened.
-                # If that's the case, we cannot use it as a reference
-                if page['id'] in self.pages_root:
-                    page_before = page
-            page_root_node = self.get_url_node_by_uuid(self.pages_root[page_before['id']])
+            page_before = self._pages_before.get(node.pageref, self._last_page_before)
+            page_root_node = self.get_url_node_by_uuid(self.pages_root[page_before])
             if dev_debug:
                 self.logger.warning(f'Failed to attach URLNode in the normal process, best guess attach to page {node.pageref} - Node: {page_root_node.uuid} - {page_root_node.name}.')
             self._make_subtree(page_root_node, [node])
 
+    def _make_subtree(self, root: URLNode, nodes_to_attach: Optional[List[URLNode]]=None) -> None:
+        """Build the tree from root, attaching nodes_to_attach to it"""
+        # NOTE: Each level yields the sub trees to build, in order, and the next sub tree is only
+        #       requested once the previous one is done: same order as the recursion it replaces,
+        #       without being limited by the depth of the tree.
+        levels: List[_SubtreeSteps] = [self._make_subtree_level(root, nodes_to_attach)]
+        while levels:
+            try:
+                sub_root, sub_nodes = next(levels[-1])
+            except StopIteration:
+                levels.pop()
+                continue
+            levels.append(self._make_subtree_level(sub_root, sub_nodes))
+
     @trace_make_subtree
-    def _make_subtree(self, root: URLNode, nodes_to_attach: Optional[List[URLNode]]=None, dev_debug: bool=False) -> None:
-        """Recursive method building each level of the tree"""
+    def _make_subtree_level(self, root: URLNode, nodes_to_attach: Optional[List[URLNode]]=None, dev_debug: bool=False) -> _SubtreeSteps:
+        """Build one level of the tree, yields the sub trees to build from there (see _make_subtree)"""
         matching_urls: List[URLNode]
         if nodes_to_attach is None:
             # We're in the actual root node
@@ -608,14 +699,14 @@ class Har2Tree(object):
         for unode in unodes:
             # NOTE: as we're calling the method recursively, a node containing URLs in its external_ressources will attach
             # the the subnodes to itself, even if the subnodes have a different referer. It will often be correct, but not always.
-            if hasattr(unode, 'redirect') and not hasattr(unode, 'redirect_to_nothing'):
+            if 'redirect' in unode.features and 'redirect_to_nothing' not in unode.features:
                 # If the subnode has a redirect URL set, we get all the requests matching this URL
                 # One may think the entry related to this redirect URL has a referer to the parent. One would be wrong.
                 # URL 1 has a referer, and redirects to URL 2. URL 2 has the same referer as URL 1.
                 # => In that case, we want to attach URL 2 to URL 1, and not to the referer of URL 1.
-                if unode.redirect_url in self.all_redirects:
-                    self.all_redirects.remove(unode.redirect_url)  # Makes sure we only follow a redirect once
-                    matching_urls = [url_node for url_node in self.all_url_requests[unode.redirect_url] if url_node in self._nodes_list]
+                if self.all_redirects.get(unode.redirect_url):
+                    self.all_redirects[unode.redirect_url] -= 1  # Makes sure we only follow a redirect once
+                    matching_urls = [url_node for url_node in self.all_url_requests[unode.redirect_url] if url_node in self._pending_nodes]
                     if len(matching_urls) > 1:
                         # NOTE 2021-05-14: a redirect only redirects to one url, if there are a more, we probably have the same url somewhere else in the tree.
                         # *but* we may still have more than one entry here: splash will sometimes add a response with status code 0, and retry it.
@@ -626,10 +717,10 @@ class Har2Tree(object):
                             if url.response['status'] != 0:
                                 break
                         matching_urls = to_attach
-                    self._nodes_list = [node for node in self._nodes_list if node not in matching_urls]
+                    self._pending_nodes.difference_update(matching_urls)
                     if dev_debug:
                         self.logger.warning(f'Redirections from {unode.name} to {matching_urls}.')
-                    self._make_subtree(unode, matching_urls)
+                    yield unode, matching_urls
                     # NOTE 2021-05-15: in case the redirect goes to self, we want to attach the remaining part of the tree to the redirected node
                     if root.name == unode.name:
                         continue
@@ -638,48 +729,58 @@ class Har2Tree(object):
 
             # The node can have a redirect, but also trigger ressources refering to themselves, we need to trigger this code on each node.
 
-            if self.all_initiator_url.get(unode.name):
+            # NOTE: the lists are dropped once a node went through them: no node they point to is left to attach.
+            #       They're only popped at the end, the nodes attached in between may need them (same URL loaded twice).
+            initiated_urls = self.all_initiator_url.get(unode.name)
+            if initiated_urls:
                 # The URL (unode.name) is in the list of known urls initiating calls
-                for u in self.all_initiator_url[unode.name]:
+                for u in initiated_urls:
                     matching_urls = [url_node for url_node in self.all_url_requests[u]
-                                     if url_node in self._nodes_list and hasattr(url_node, 'initiator_url') and url_node.initiator_url == unode.name]
-                    self._nodes_list = [node for node in self._nodes_list if node not in matching_urls]
+                                     if url_node in self._pending_nodes and 'initiator_url' in url_node.features and url_node.initiator_url == unode.name]
+                    self._pending_nodes.difference_update(matching_urls)
                     if dev_debug:
                         self.logger.warning(f'Found via initiator from {unode.name} to {matching_urls}.')
-                    self._make_subtree(unode, matching_urls)
+                    yield unode, matching_urls
+                self.all_initiator_url.pop(unode.name, None)
 
-            if self.all_referer.get(unode.name):
+            referred_urls = self.all_referer.get(unode.name)
+            if referred_urls:
                 # The URL (unode.name) is in the list of known referers
-                for u in self.all_referer[unode.name]:
+                for u in referred_urls:
                     matching_urls = [url_node for url_node in self.all_url_requests[u]
-                                     if url_node in self._nodes_list and hasattr(url_node, 'referer') and url_node.referer == unode.name]
-                    self._nodes_list = [node for node in self._nodes_list if node not in matching_urls]
+                                     if url_node in self._pending_nodes and 'referer' in url_node.features and url_node.referer == unode.name]
+                    self._pending_nodes.difference_update(matching_urls)
                     if dev_debug:
                         self.logger.warning(f'Found via referer from {unode.name} to {matching_urls}.')
-                    self._make_subtree(unode, matching_urls)
+                    yield unode, matching_urls
+                self.all_referer.pop(unode.name, None)
 
-            if self.all_referer.get(unode.alternative_url_for_referer):
+            alternative_url = unode.alternative_url_for_referer
+            # NOTE: without a fragment, it is the URL itself, and its referers were just processed.
+            referred_urls = self.all_referer.get(alternative_url)
+            if referred_urls:
                 # The URL (unode.name) stripped at the first `#` is in the list of known referers
-                for u in self.all_referer[unode.alternative_url_for_referer]:
+                for u in referred_urls:
                     matching_urls = [url_node for url_node in self.all_url_requests[u]
-                                     if url_node in self._nodes_list and hasattr(url_node, 'referer') and url_node.referer == unode.alternative_url_for_referer]
-                    self._nodes_list = [node for node in self._nodes_list if node not in matching_urls]
+                                     if url_node in self._pending_nodes and 'referer' in url_node.features and url_node.referer == alternative_url]
+                    self._pending_nodes.difference_update(matching_urls)
                     if dev_debug:
                         self.logger.warning(f'Found via alternative referer from {unode.name} to {matching_urls}.')
-                    self._make_subtree(unode, matching_urls)
+                    yield unode, matching_urls
+                self.all_referer.pop(alternative_url, None)
 
-            if hasattr(unode, 'external_ressources'):
+            if 'external_ressources' in unode.features:
                 # the url loads external things, and some of them have no referer....
                 for external_tag, links in unode.external_ressources.items():
                     for link in links:
                         if link not in self.all_url_requests:
                             # We have a lot of false positives
                             continue
-                        matching_urls = [url_node for url_node in self.all_url_requests[link] if url_node in self._nodes_list]
-                        self._nodes_list = [node for node in self._nodes_list if node not in matching_urls]
+                        matching_urls = [url_node for url_node in self.all_url_requests[link] if url_node in self._pending_nodes]
+                        self._pending_nodes.difference_update(matching_urls)
                         if dev_debug:
                             self.logger.warning(f'Found from {unode.name} via external ressources ({external_tag}): {matching_urls}.')
-                        self._make_subtree(unode, matching_urls)
+                        yield unode, matching_urls
 
     def __repr__(self) -> str:
         return f'Har2Tree({self.har.path}, {self.har.capture_uuid})'
@@ -2,32 +2,66 @@
 # -*- coding: utf-8 -*-
 
 import os
+import posixpath
 import re
 from collections import defaultdict
-from typing import Optional, List, Tuple, Dict, Mapping, MutableMapping, Any
+from functools import lru_cache
+from typing import Optional, List, Tuple, Dict, Mapping, MutableMapping, Any, Container, Union
 from base64 import b64decode
 import binascii
 import hashlib
 import logging
-from urllib.parse import urlparse, unquote_plus, unquote_to_bytes, urljoin
+from urllib.parse import urlparse, unquote_plus, unquote_to_bytes, urljoin, ParseResult
 from io import BytesIO
-from bs4 import BeautifulSoup  # type: ignore
+from bs4 import BeautifulSoup, SoupStrainer  # type: ignore
 
 import filetype  # type: ignore
 
 logger = logging.getLogger(__name__)
 
+# Only the tags find_external_ressources looks at are kept when parsing the HTML
+_ressources_tags = ['img', 'script', 'video', 'audio', 'iframe', 'embed', 'source', 'link', 'object']
+_parsed_tags = _ressources_tags + ['meta']
+_ressources_strainer = SoupStrainer(_parsed_tags)
+
+# Keys of the external ressources found in a document, see find_external_ressources
+external_ressources_types = ('img', 'script', 'video', 'audio', 'iframe', 'embed', 'source', 'link', 'object',
+                             'css', 'full_regex', 'javascript', 'meta_refresh')
+
+# The regexes are used on every body, compile them once
+_b64_regex = re.compile('[A-Za-z0-9+/]*={0,2}')
+_meta_refresh_regex = re.compile("^refresh$", re.I)
+_css_url_regex = re.compile(rb'url\((.*?)\)')
+_js_location_regex = re.compile(b'(?:window|self|top).location(?:.*)\"(.*?)\"')
+_js_unescape_regex = re.compile(br'unescape\(\'(.*)\'\)')
+# NOTE: this used to be (?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\(\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+
+#       $-_ is a range (0x24 to 0x5f: digits, uppercase, % and most of the punctuation), so it is the same
+#       as a single character class, without trying each alternative on every character.
+_full_url_regex = re.compile(rb'(?:http[s]?:)?//[!$-_a-z]+')
+
+
+@lru_cache(maxsize=4096)
+def cached_urlparse(url: str) -> ParseResult:
+    """Same as urlparse, but the result is cached: while building a tree, the same URLs are parsed many times."""
+    return urlparse(url)
+
+
+def random_uuid() -> str:
+    """Same format as str(uuid.uuid4()) (random UUID, version 4), without building a UUID object for each node."""
+    h = os.urandom(16).hex()
+    return f'{h[:8]}-{h[8:12]}-4{h[13:16]}-{"89ab"[int(h[16], 16) & 3]}{h[17:20]}-{h[20:]}'
+
 
 def parse_data_uri(uri: str) -> Optional[Tuple[str, str, bytes]]:
     if not uri.startswith('data:'):
         return None
     uri = uri[5:]
     if ';base64' in uri:
-        mime, b64data = uri.split(';base64', 1)
+        mime, _, b64data = uri.partition(';base64')
         if not b64data or b64data[0] != ',':
             return None
         b64data = b64data[1:].strip()
-        if not re.fullmatch('[A-Za-z0-9+/]*={0,2}', b64data):
+        if not _b64_regex.fullmatch(b64data):
             return None
         if len(b64data) % 4:
             # Note: Too many = isn't a problem.
@@ -40,12 +74,12 @@ def parse_data_uri(uri: str) -> Optional[Tuple[str, str, bytes]]:
     else:
         if ',' not in uri:
             return None
-        mime, d = uri.split(',', 1)
+        mime, _, d = uri.partition(',')
         data = d.encode()
 
     if mime:
         if ';' in mime:
-            mime, mimeparams = mime.split(';', 1)
+            mime, _, mimeparams = mime.partition(';')
         else:
             mimeparams = ''
     else:
@@ -54,20 +88,60 @@ def parse_data_uri(uri: str) -> Optional[Tuple[str, str, bytes]]:
     return mime, mimeparams, data
 
 
-def rebuild_url(base_url: str, partial: str, known_urls: List[str]) -> str:
+@lru_cache(maxsize=256)
+def classify_mimetype(mimetype: str) -> str:
+    """Name of the feature to set on a URL node, depending on the mimetype of the response.
+    NOTE: the order of the checks matters (application/javascript+json is js), and a capture only has a handful of different mimetypes."""
+    if 'javascript' in mimetype or 'ecmascript' in mimetype:
+        return 'js'
+    elif mimetype.startswith('image'):
+        return 'image'
+    elif mimetype.startswith('text/css'):
+        return 'css'
+    elif 'json' in mimetype:
+        return 'json'
+    elif 'html' in mimetype:
+        return 'html'
+    elif 'font' in mimetype:
+        return 'font'
+    elif 'octet-stream' in mimetype:
+        return 'octet_stream'
+    elif ('text/plain' in mimetype or 'xml' in mimetype
+            or 'application/x-www-form-urlencoded' in mimetype):
+        return 'text'
+    elif 'video' in mimetype:
+        return 'video'
+    elif 'audio' in mimetype:
+        return 'audio'
+    elif 'mpegurl' in mimetype.lower():
+        return 'livestream'
+    elif ('application/x-shockwave-flash' in mimetype
+            or 'application/x-shockware-flash' in mimetype):  # Yes, shockwaRe
+        return 'flash'
+    elif 'application/pdf' in mimetype:
+        return 'pdf'
+    elif not mimetype:
+        return 'unset_mimetype'
+    return 'unknown_mimetype'
+
+
+def rebuild_url(base_url: str, partial: str, known_urls: Container[str], splitted_base_url: Optional[ParseResult]=None) -> str:
     """
     The last part of a URL can be reconnected to its base in plenty different ways.
     This method aims to do that in a generic manner.
     As we know the list of possible URLs in the capture, we check for a match against that list.
+    `known_urls` is only used for membership tests, it should be a set (or a dict).
+    `splitted_base_url` is the parsed `base_url`, if the caller already has it.
     """
-    splitted_base_url = urlparse(base_url)
+    if splitted_base_url is None:
+        splitted_base_url = cached_urlparse(base_url)
     # Remove all possible quotes
     partial = partial.strip()
     partial = unquote_plus(partial)
     if not partial:
         return ''
 
-    if re.match('^https?://', partial):
+    if partial.startswith(('http://', 'https://')):
         # we have a proper URL... hopefully
         final_url = partial
     else:
@@ -80,28 +154,28 @@ def rebuild_url(base_url: str, partial: str, known_urls: List[str]) -> str:
             if final_url not in known_urls and '#' in partial and '#' not in final_url:
                 final_url += '#'
         except Exception:
-            logger.debug(f'Partial {partial} probably not a url')
+            logger.debug('Partial %s probably not a url', partial)
             return ''
 
-    if final_url not in known_urls:
+    if final_url not in known_urls and (':443' in final_url or ':80' in final_url):
         # sometimes, the port is in the partial, but striped in the list of known urls.
         try:
-            final_parsed = urlparse(final_url)
+            final_parsed = cached_urlparse(final_url)
             if final_url.startswith('https://') and final_parsed.netloc.endswith(':443'):
                 final_url = final_url.replace(':443', '', 1)
             if final_url.startswith('http://') and final_parsed.netloc.endswith(':80'):
                 final_url = final_url.replace(':80', '', 1)
         except Exception:
-            logger.debug(f'Not a URL: {base_url} - {partial}')
+            logger.debug('Not a URL: %s - %s', base_url, partial)
 
     if final_url not in known_urls:
         # On a redirect, if the initial URL has a fragment, it is appended to the destination URL
         if splitted_base_url.fragment:
             try:
-                parsed = urlparse(final_url)
+                parsed = cached_urlparse(final_url)
                 final_url = parsed._replace(fragment=splitted_base_url.fragment).geturl()
             except Exception:
-                logger.debug(f'Not a URL: {base_url} - {partial}')
+                logger.debug('Not a URL: %s - %s', base_url, partial)
         elif '#' in base_url and '#' not in final_url:
             # NOTE 2021-05-26: if the fragment is empty, splitted_base_url.fragment is false, but the # will still be in the redirect
             final_url += '#'
@@ -109,11 +183,11 @@ def rebuild_url(base_url: str, partial: str, known_urls: List[str]) -> str:
     if final_url not in known_urls:
         # strip the single-dot crap: https://foo.bar/path/./blah.js => https://foo.bar/path/blah.js
         try:
-            parsed = urlparse(final_url)
+            parsed = cached_urlparse(final_url)
             if parsed.path:
                 # NOTE Path('<complex path>').resolve() can return a path on the local system, and follow the symlinks. We don't want that.
-                # That's the reason we use os.path.normpath
-                resolved_path = os.path.normpath(parsed.path)
+                # That's the reason we use normpath, and the posix one: URL paths always use '/'
+                resolved_path = posixpath.normpath(parsed.path)
                 final_url = parsed._replace(path=resolved_path).geturl()
                 if final_url not in known_urls and resolved_path[-1] != '/':
                     # NOTE: the last '/' at the end of the path is stripped by normpath, we try to re-add it
@@ -123,31 +197,42 @@ def rebuild_url(base_url: str, partial: str, known_urls: List[str]) -> str:
                 # No path, just make it a /
                 final_url = parsed._replace(path='/').geturl()
         except Exception:
-            logger.debug(f'Not a URL: {base_url} - {partial}')
+            logger.debug('Not a URL: %s - %s', base_url, partial)
 
     return final_url
 
 
-def url_cleanup(dict_to_clean: Mapping[str, List[str]], base_url: str, all_requests: List[str]) -> Dict[str, List[str]]:
+def url_cleanup(dict_to_clean: Mapping[str, List[str]], base_url: str, all_requests: Container[str]) -> Dict[str, List[str]]:
     """
     Standalone methods to cleanup URLs extracted from an HTML blob.
     """
     to_return: Dict[str, List[str]] = {}
+    if isinstance(all_requests, list):
+        # rebuild_url checks each URL against all_requests up to 6 times
+        all_requests = set(all_requests)
+    splitted_base_url = cached_urlparse(base_url)
+    # The same URLs are often found many times in a document, only rebuild them once
+    rebuilt_urls: Dict[str, str] = {}
     for key, urls in dict_to_clean.items():
         to_return[key] = []
         for url in urls:
             if url.startswith('data'):
                 continue
-            to_attach = url.strip()
-            if to_attach.startswith("\\'") or to_attach.startswith('\\"'):
-                to_attach = to_attach[2:-2]
-            if to_attach.startswith("'") or to_attach.startswith('"'):
-                to_attach = to_attach[1:-1]
-            if to_attach.endswith("'") or to_attach.endswith('"'):
-                # A quote at the end of the URL can be selected by the fulltext regex
-                to_attach = to_attach[:-1]
-
-            to_attach = rebuild_url(base_url, to_attach, all_requests)
+            if url in rebuilt_urls:
+                to_attach = rebuilt_urls[url]
+            else:
+                to_attach = url.strip()
+                # NOTE: not a strip('\'"'): a quote at the beginning removes the last character, quote or not.
+                if to_attach.startswith(("\\'", '\\"')):
+                    to_attach = to_attach[2:-2]
+                if to_attach.startswith(("'", '"')):
+                    to_attach = to_attach[1:-1]
+                if to_attach.endswith(("'", '"')):
+                    # A quote at the end of the URL can be selected by the fulltext regex
+                    to_attach = to_attach[:-1]
+
+                to_attach = rebuild_url(base_url, to_attach, all_requests, splitted_base_url)
+                rebuilt_urls[url] = to_attach
 
             if to_attach == base_url:
                 # Ignore what is basically a loop.
@@ -156,7 +241,7 @@ def url_cleanup(dict_to_clean: Mapping[str, List[str]], base_url: str, all_reque
             if to_attach.startswith('http'):
                 to_return[key].append(to_attach)
             else:
-                logger.debug('{key} - not a URL - {to_attach}')
+                logger.debug('%s - not a URL - %s', key, to_attach)
     return to_return
 
 
@@ -173,15 +258,14 @@ def _unpack_data_uri(data: str) -> Optional[Tuple[str, str, BytesIO]]:
                 else:
                     mime = ''
 
-            blob = BytesIO(unpacked_data)
-            b_hash = hashlib.sha512(blob.getvalue()).hexdigest()
-            return mime, b_hash, blob
+            b_hash = hashlib.sha512(unpacked_data).hexdigest()
+            return mime, b_hash, BytesIO(unpacked_data)
     except ValueError as e:
-        logger.warning(e, data)
+        logger.warning('Unable to unpack the data URI %s: %s', data, e)
     return None
 
 
-def find_external_ressources(html_doc: BytesIO, base_url: str, all_requests: List[str], full_text_search: bool=True) -> Tuple[Dict[str, List[str]], Dict[str, List[Tuple[str, BytesIO]]]]:
+def find_external_ressources(html_doc: Union[bytes, BytesIO], base_url: str, all_requests: Container[str], full_text_search: bool=True) -> Tuple[Dict[str, List[str]], Dict[str, List[Tuple[str, BytesIO]]]]:
     """ Get URLs to external contents out of an HTML blob."""
     # Source: https://stackoverflow.com/questions/31666584/beutifulsoup-to-extract-all-external-resources-from-html
     # Because this is awful.
@@ -194,19 +278,21 @@ def find_external_ressources(html_doc: BytesIO, base_url: str, all_requests: Lis
     # source: https://www.w3schools.com/TAGs/tag_source.asp -> src srcset
     # link: https://www.w3schools.com/TAGs/tag_link.asp -> href
     # object: https://www.w3schools.com/TAGs/tag_object.asp -> data
-    external_ressources: Dict[str, List[str]] = {'img': [], 'script': [], 'video': [], 'audio': [],
-                                                 'iframe': [], 'embed': [], 'source': [],
-                                                 'link': [],
-                                                 'object': [],
-                                                 'css': [],
-                                                 'full_regex': [],
-                                                 'javascript': [],
-                                                 'meta_refresh': []}
+    external_ressources: Dict[str, List[str]] = {ressource_type: [] for ressource_type in external_ressources_types}
 
     embedded_ressources: Dict[str, List[Tuple[str, BytesIO]]] = defaultdict(list)
 
-    soup = BeautifulSoup(html_doc.getvalue(), 'lxml')
-    for link in soup.find_all(['img', 'script', 'video', 'audio', 'iframe', 'embed', 'source', 'link', 'object']):
+    # NOTE: getvalue copies the whole buffer, callers should pass the bytes if they have them.
+    raw_html = html_doc.getvalue() if isinstance(html_doc, BytesIO) else html_doc
+    soup = BeautifulSoup(raw_html, 'lxml', parse_only=_ressources_strainer)
+    meta_refresh = None
+    for link in soup.find_all(_parsed_tags):
+        if link.name == 'meta':
+            # Search for meta refresh redirect madness, only the first one matters
+            http_equiv = link.get('http-equiv')
+            if meta_refresh is None and isinstance(http_equiv, str) and _meta_refresh_regex.search(http_equiv):
+                meta_refresh = link
+            continue
         uri = None
         if link.get('src'):  # img script video audio iframe embed source
             uri = link.get('src')
@@ -231,15 +317,13 @@ def find_external_ressources(html_doc: BytesIO, base_url: str, all_requests: Lis
         else:
             external_ressources[link.name].append(unquote_plus(uri))
 
-    # Search for meta refresh redirect madness
-    # NOTE: we may want to move that somewhere else, but that's currently the only place BeautifulSoup is used.
-    meta_refresh = soup.find('meta', attrs={'http-equiv': re.compile("^refresh$", re.I)})
+    # NOTE: we may want to move the meta refresh somewhere else, but that's currently the only place BeautifulSoup is used.
     if meta_refresh and meta_refresh.get('content'):
         # NOTE 2021-05-15: in theory, a meta key look like that: <number>;url=<url>
         # but the url= part may not be present
         content = meta_refresh['content'].strip()
         if ';' in content:
-            timeout, url = content.split(';', 1)
+            timeout, _, url = content.partition(';')
             if timeout.isdigit():
                 # Strip timeout
                 content = url.strip()
@@ -248,11 +332,11 @@ def find_external_ressources(html_doc: BytesIO, base_url: str, all_requests: Lis
         external_ressources['meta_refresh'].append(content)
 
     # external stuff loaded from css content, because reasons.
-    for url in re.findall(rb'url\((.*?)\)', html_doc.getvalue()):
+    for url in _css_url_regex.findall(raw_html):
         try:
             url = url.decode()
         except UnicodeDecodeError as e:
-            logger.info(f'Unable to decode {url}: {e}')
+            logger.info('Unable to decode %r: %s', url, e)
             continue
         if url.startswith('data:'):
             unpacked = _unpack_data_uri(url)
@@ -264,25 +348,24 @@ def find_external_ressources(html_doc: BytesIO, base_url: str, all_requests: Lis
 
     # Javascript changing the current page
     # I never found a website where it matched anything useful
-    external_ressources['javascript'] = [url.decode() for url in re.findall(b'(?:window|self|top).location(?:.*)\"(.*?)\"', html_doc.getvalue())]
+    external_ressources['javascript'] = [url.decode() for url in _js_location_regex.findall(raw_html)]
     # NOTE: we may want to extract calls to decodeURI and decodeURIComponent
     # https://developer.mozilla.org/en-US/docs/Web/JavaScript/Reference/Global_Objects/decodeURI
     # https://developer.mozilla.org/en-US/docs/Web/JavaScript/Reference/Global_Objects/decodeURIComponent
     # Just in case, there is sometimes an unescape call in JS code
-    for to_unescape in re.findall(br'unescape\(\'(.*)\'\)', html_doc.getvalue()):
+    for to_unescape in _js_unescape_regex.findall(raw_html):
         unescaped = unquote_to_bytes(to_unescape)
         kind = filetype.guess(unescaped)
         if kind:
             mimetype = kind.mime
         else:
             mimetype = ''
-        blob = BytesIO(unescaped)
-        b_hash = hashlib.sha512(blob.getvalue()).hexdigest()
-        embedded_ressources[mimetype].append((b_hash, blob))
+        b_hash = hashlib.sha512(unescaped).hexdigest()
+        embedded_ressources[mimetype].append((b_hash, BytesIO(unescaped)))
 
     if full_text_search:
         # Just regex in the whole blob, because we can
-        external_ressources['full_regex'] = [url.decode() for url in re.findall(rb'(?:http[s]?:)?//(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\(\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', html_doc.getvalue())]
+        external_ressources['full_regex'] = [url.decode() for url in _full_url_regex.findall(raw_html)]
         # print("################ REGEXES ", external_ressources['full_regex'])
     # NOTE: unescaping a potential URL as HTML content can make it unusable (example: (...)&ltime=(...>) => (...)<ime=(...))
     return url_cleanup(external_ressources, base_url, all_requests), embedded_ressources
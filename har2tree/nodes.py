@@ -2,19 +2,19 @@
 # -*- coding: utf-8 -*-
 
 from pathlib import Path
-from typing import List, Optional, Union, Tuple, Set, MutableMapping, Any
+from typing import Dict, List, Optional, Union, Tuple, Set, FrozenSet, Mapping, MutableMapping, Any, Container
 import logging
-import uuid
+import sys
 import json
-from .helper import find_external_ressources, rebuild_url
+from .helper import find_external_ressources, rebuild_url, cached_urlparse, classify_mimetype, random_uuid, external_ressources_types
 from io import BytesIO
 from urllib.parse import unquote_plus, urlparse, urljoin
-import sys
 from datetime import datetime, timedelta
 import ipaddress
 from base64 import b64decode
 import hashlib
 import re
+from functools import lru_cache
 from .helper import Har2TreeError, Har2TreeLogAdapter
 
 import filetype  # type: ignore
@@ -33,28 +33,58 @@ except Exception as e:
     psl = PublicSuffixList()
 
 
+@lru_cache(maxsize=2048)
+def _get_tld(hostname: str) -> Optional[str]:
+    """Lookup in the public suffix list, cached: most hostnames are loaded many times in a capture."""
+    return psl.get_tld(hostname, strict=True)
+
+
+# Since python 3.11, fromisoformat parses most of ISO 8601, including the trailing Z
+_fromisoformat_is_iso8601 = sys.version_info >= (3, 11)
+
+# Content we do not search for URLs
+_binary_mimetype_features = frozenset(['image', 'video', 'audio', 'font'])
+
+# Common JS redirect we can catch easily
+# NOTE: it is extremely fragile and doesn't work very often but is kinda better than nothing.
+# Source: https://stackoverflow.com/questions/13363174/regular-expression-to-catch-as-many-javascript-redirections-as-possible
+_js_redirect_regex = re.compile(br"""((location.href)|(window.location)|(location.replace)|(location.assign))(( ?= ?)|( ?\( ?))("|')([^'"]*)("|')( ?\) ?)?;""", re.I)
+
+
+def _decode_body(content: Mapping[str, Any]) -> bytes:
+    """Decode the text of the content of a response in a HAR entry."""
+    if content.get('encoding') == 'base64':
+        return b64decode(content['text'])
+    return content['text'].encode()
+
+
 class HarTreeNode(TreeNode):
 
+    # Features not added in the json dump
+    features_to_skip: FrozenSet[str] = frozenset(['dist', 'support'])
+
     def __init__(self, capture_uuid: str, **kwargs: Any):
         """Node dumpable in json to display with d3js"""
         super(HarTreeNode, self).__init__(**kwargs)
         logger = logging.getLogger(f'{__name__}.{self.__class__.__name__}')
         self.logger = Har2TreeLogAdapter(logger, {'uuid': capture_uuid})
-        self.add_feature('uuid', str(uuid.uuid4()))
-        self.features_to_skip = set(['dist', 'support'])
+        self.add_feature('uuid', random_uuid())
+
+    def _add_features(self, features: Mapping[str, Any]) -> None:
+        """Same as calling add_feature for each of the features, in one go.
+        Only for plain attributes: dist and support are properties and must go through add_feature."""
+        self.features.update(features)
+        self.__dict__.update(features)
 
     def to_dict(self) -> MutableMapping[str, Any]:
         """Make a dict that can then be dumped in json.
         """
-        to_return = {'uuid': self.uuid, 'children': []}
-        for feature in self.features:
-            if feature in self.features_to_skip:
-                continue
-            to_return[feature] = getattr(self, feature)
-
-        for child in self.children:
-            to_return['children'].append(child)
-
+        to_return: MutableMapping[str, Any] = {'uuid': self.uuid, 'children': list(self.children)}
+        # All the features we dump are plain attributes (dist and support are skipped), no need for getattr
+        attributes = self.__dict__
+        features_to_skip = self.features_to_skip
+        to_return.update({feature: attributes[feature] for feature in self.features
+                          if feature not in features_to_skip})
         return to_return
 
     def to_json(self) -> str:
@@ -64,52 +94,78 @@ class HarTreeNode(TreeNode):
 
 class URLNode(HarTreeNode):
 
+    # Do not add the body in the json dump
+    features_to_skip = HarTreeNode.features_to_skip | {'body', 'body_size', 'url_split', 'start_time', 'time',
+                                                       'time_content_received', 'ip_address'}
+
     def __init__(self, capture_uuid: str, **kwargs: Any):
         """Node of the URL Tree"""
         super(URLNode, self).__init__(capture_uuid=capture_uuid, **kwargs)
-        # Do not add the body in the json dump
-        self.features_to_skip.add('body')
-        self.features_to_skip.add('url_split')
-        self.features_to_skip.add('start_time')
-        self.features_to_skip.add('time')
-        self.features_to_skip.add('time_content_received')
-        self.features_to_skip.add('ip_address')
-
-    def load_har_entry(self, har_entry: MutableMapping[str, Any], all_requests: List[str], rendered_html: Optional[BytesIO]=None) -> None:
+
+    @property
+    def body(self) -> BytesIO:
+        """Body of the response. It is decoded from the HAR entry on each access instead of
+        keeping a decoded copy of every body in memory, the HAR entry is kept anyway (response feature)."""
+        if self.body_set_explicitly():
+            return self._body
+        if 'body' not in self.features:
+            raise AttributeError('body')
+        return BytesIO(_decode_body(self.response['content']))
+
+    @body.setter
+    def body(self, body: BytesIO) -> None:
+        self._body = body
+
+    def body_set_explicitly(self) -> bool:
+        """True if the body was assigned to the node, False if it is decoded from the response on access."""
+        return '_body' in self.__dict__
+
+    def load_har_entry(self, har_entry: MutableMapping[str, Any], all_requests: Container[str], rendered_html: Optional[BytesIO]=None) -> None:
         """Load one entry of the HAR file, initialize most of the features of the node"""
+        request = har_entry['request']
+        response = har_entry['response']
+        content = response['content']
+
         if not self.name:
             # We're in the actual root node
             # NOTE: by the HAR specs: "Absolute URL of the request (fragments are not included)."
-            self.add_feature('name', unquote_plus(har_entry['request']['url']))
-
-        self.add_feature('url_split', urlparse(self.name))
+            self.add_feature('name', unquote_plus(request['url']))
 
         if rendered_html:
             self.add_feature('rendered_html', rendered_html)
 
-        # If the URL contains a fragment (i.e. something after a #), it is stripped in the referer.
-        # So we need an alternative URL to do a lookup against
-        self.add_feature('alternative_url_for_referer', self.name.split('#')[0])
-
         # Instant the request is made
-        if sys.version_info < (3, 7) and har_entry['startedDateTime'][-1] == 'Z':
-            # Python 3.7:
-            #   * fromisoformat does not like Z at the end of the string, and wants +XX:XX (not +XXXX)
-            #   * strptime %z is cool with Z (=>tzinfo=datetime.timezone.utc) or +XXXX or +XX:XX
-            # Python 3.6:
-            #   * No fromisoformat
-            #   * strptime %z does not like Z at the end of the string, and doesn't like +XX:XX either (wants +XXXX)
-            har_entry['startedDateTime'] = har_entry['startedDateTime'].replace('Z', '+0000')
-        if '.' in har_entry['startedDateTime']:
-            self.add_feature('start_time', datetime.strptime(har_entry['startedDateTime'], '%Y-%m-%dT%H:%M:%S.%f%z'))
-        else:
-            self.add_feature('start_time', datetime.strptime(har_entry['startedDateTime'], '%Y-%m-%dT%H:%M:%S%z'))
-
-        self.add_feature('pageref', har_entry['pageref'])
-
-        self.add_feature('time', timedelta(milliseconds=har_entry['time']))
-        self.add_feature('time_content_received', self.start_time + self.time)  # Instant the response is fully received (and the processing of the content by the browser can start)
-        self.add_feature('hostname', self.url_split.hostname)
+        started_date_time = har_entry['startedDateTime']
+        try:
+            # NOTE: before python 3.11, fromisoformat doesn't like the Z at the end of the string,
+            #       and only accepts 3 or 6 digits in the fraction of seconds.
+            if _fromisoformat_is_iso8601:
+                start_time = datetime.fromisoformat(started_date_time)
+            else:
+                start_time = datetime.fromisoformat(started_date_time.replace('Z', '+00:00'))
+        except ValueError:
+            # strptime is more lenient (but much slower)
+            if '.' in started_date_time:
+                start_time = datetime.strptime(started_date_time, '%Y-%m-%dT%H:%M:%S.%f%z')
+            else:
+                start_time = datetime.strptime(started_date_time, '%Y-%m-%dT%H:%M:%S%z')
+        time = timedelta(milliseconds=har_entry['time'])
+        url_split = cached_urlparse(self.name)
+
+        self._add_features({
+            'url_split': url_split,
+            # If the URL contains a fragment (i.e. something after a #), it is stripped in the referer.
+            # So we need an alternative URL to do a lookup against
+            'alternative_url_for_referer': self.name.partition('#')[0],
+            'start_time': start_time,
+            'pageref': har_entry['pageref'],
+            'time': time,
+            'time_content_received': start_time + time,  # Instant the response is fully received (and the processing of the content by the browser can start)
+            'hostname': url_split.hostname,
+            'request': request,
+            'response': response,
+            'response_cookie': response['cookies'],
+            'request_cookie': request['cookies']})
 
         if not self.hostname:
             self.logger.warning(f'Something is broken in that node: {har_entry}')
@@ -122,36 +178,38 @@ class URLNode(HarTreeNode):
             pass
 
         if not hasattr(self, 'hostname_is_ip'):
-            tld = psl.get_tld(self.hostname, strict=True)
+            tld = _get_tld(self.hostname)
             if tld:
                 self.add_feature('known_tld', tld)
             else:
-                self.logger.info(f'###### No TLD/domain broken {self.name}')
+                self.logger.info('###### No TLD/domain broken %s', self.name)
 
-        self.add_feature('request', har_entry['request'])
         # Try to get a referer from the headers
-        for h in self.request['headers']:
-            if h['name'].lower() == 'referer':
-                self.add_feature('referer', unquote_plus(h['value']))
-            if h['name'].lower() == 'user-agent':
-                self.add_feature('user_agent', h['value'])
-
-        if 'method' in self.request and self.request['method'] == 'POST' and 'postData' in self.request:
+        # NOTE: if a header is there more than once, the last one wins
+        headers = {h['name'].lower(): h['value'] for h in request['headers']}
+        if 'referer' in headers:
+            self.add_feature('referer', unquote_plus(headers['referer']))
+        if 'user-agent' in headers:
+            self.add_feature('user_agent', headers['user-agent'])
+
+        if 'method' in request and request['method'] == 'POST' and 'postData' in request:
+            post_data = request['postData']
             # If the content is empty, we don't care
-            if self.request['postData']['text']:
+            if post_data['text']:
                 # We have a POST request, the data can be base64 encoded or urlencoded
-                posted_data: Union[str, bytes] = self.request['postData']['text']
-                if 'encoding' in self.request['postData']:
-                    if self.request['postData']['encoding'] == 'base64':
+                posted_data: Union[str, bytes] = post_data['text']
+                if 'encoding' in post_data:
+                    if post_data['encoding'] == 'base64':
                         if len(posted_data) % 4:
                             # a this point, we have a string for sure
                             posted_data += '==='  # type: ignore
                         posted_data = b64decode(posted_data)
                     else:
-                        self.logger.warning(f'Unexpected encoding: {self.request["postData"]["encoding"]}')
+                        self.logger.warning(f'Unexpected encoding: {post_data["encoding"]}')
 
-                if 'mimeType' in self.request['postData']:
-                    if self.request['postData']['mimeType'].startswith('application/x-www-form-urlencoded'):
+                if 'mimeType' in post_data:
+                    post_data_mimetype = post_data['mimeType']
+                    if post_data_mimetype.startswith('application/x-www-form-urlencoded'):
                         # 100% sure there will be websites where decode will fail
                         if isinstance(posted_data, bytes):
                             try:
@@ -160,30 +218,30 @@ class URLNode(HarTreeNode):
                                 self.logger.warning(f'Expected urlencoded, got garbage: {posted_data!r}')
                         if isinstance(posted_data, str):
                             posted_data = unquote_plus(posted_data)
-                    elif self.request['postData']['mimeType'].startswith('application/json') or self.request['postData']['mimeType'].startswith('application/csp-report'):
+                    elif post_data_mimetype.startswith('application/json') or post_data_mimetype.startswith('application/csp-report'):
                         try:
                             posted_data = json.loads(posted_data)
                         except Exception:
-                            self.logger.warning(f"Expected json, got garbage: {self.request['postData']['mimeType']} - {posted_data!r}")
+                            self.logger.warning(f"Expected json, got garbage: {post_data_mimetype} - {posted_data!r}")
 
-                    elif self.request['postData']['mimeType'].startswith('multipart/form-data'):
+                    elif post_data_mimetype.startswith('multipart/form-data'):
                         # FIXME multipart content (similar to email). Not totally sure what do do with it tight now.
                         pass
-                    elif self.request['postData']['mimeType'].startswith('application/x-protobuffer'):
+                    elif post_data_mimetype.startswith('application/x-protobuffer'):
                         # FIXME If possible, decode?
                         pass
-                    elif self.request['postData']['mimeType'].startswith('text'):
+                    elif post_data_mimetype.startswith('text'):
                         # We got text, keep what we already have
                         pass
-                    elif self.request['postData']['mimeType'] == '?':
+                    elif post_data_mimetype == '?':
                         # Just skip it, no need to go in the warnings
                         pass
-                    elif self.request['postData']['mimeType'] == 'application/octet-stream':
+                    elif post_data_mimetype == 'application/octet-stream':
                         # Should flag it.
                         pass
                     else:
                         # Weird stuff: Image/GIF application/unknown application/grpc-web+proto
-                        self.logger.warning(f'Unexpected mime type: {self.request["postData"]["mimeType"]}')
+                        self.logger.warning(f'Unexpected mime type: {post_data_mimetype}')
 
                 # The data may be json, try to load it
                 try:
@@ -199,9 +257,6 @@ class URLNode(HarTreeNode):
                         pass
                 self.add_feature('posted_data', posted_data)
 
-        self.add_feature('response', har_entry['response'])
-
-        self.add_feature('response_cookie', har_entry['response']['cookies'])
         if self.response_cookie:
             self.add_feature('set_third_party_cookies', False)
             # https://developer.mozilla.org/en-US/docs/Web/HTTP/headers/Set-Cookie
@@ -223,7 +278,6 @@ class URLNode(HarTreeNode):
                     is_3rd_party = True
                 self.cookies_received.append((cookie_domain, f'{cookie["name"]}={cookie["value"]}', is_3rd_party))
 
-        self.add_feature('request_cookie', har_entry['request']['cookies'])
         if self.request_cookie:
             # https://developer.mozilla.org/en-US/docs/Web/HTTP/headers/Set-Cookie
             # Cookie name must not contain "=", so we can use it safely
@@ -234,28 +288,36 @@ class URLNode(HarTreeNode):
             for cookie in self.request_cookie:
                 self.cookies_sent[f'{cookie["name"]}={cookie["value"]}'] = []
 
-        if not har_entry['response']['content'].get('text') or har_entry['response']['content']['text'] == '':
+        if not content.get('text') or content['text'] == '':
             # If the content of the response is empty, skip.
             self.add_feature('empty_response', True)
         else:
             self.add_feature('empty_response', False)
-            if har_entry['response']['content'].get('encoding') == 'base64':
-                self.add_feature('body', BytesIO(b64decode(har_entry['response']['content']['text'])))
-            else:
-                self.add_feature('body', BytesIO(har_entry['response']['content']['text'].encode()))
-            self.add_feature('body_hash', hashlib.sha512(self.body.getvalue()).hexdigest())
-            if har_entry['response']['content']['mimeType']:
-                self.add_feature('mimetype', har_entry['response']['content']['mimeType'])
+            # NOTE: the body is decoded once for the processing below, the body property decodes it again if needed
+            body = _decode_body(content)
+            self.features.add('body')
+            self.add_feature('body_size', len(body))
+            self.add_feature('body_hash', hashlib.sha512(body).hexdigest())
+            if content['mimeType']:
+                self.add_feature('mimetype', content['mimeType'])
             else:
-                kind = filetype.guess(self.body.getvalue())
+                kind = filetype.guess(body)
                 if kind:
                     self.add_feature('mimetype', kind.mime)
                 else:
                     self.add_feature('mimetype', '')
-
-            external_ressources, embedded_ressources = find_external_ressources(self.body, self.name, all_requests)
+            mimetype_feature = classify_mimetype(self.mimetype)
+            # Binary content we have no way to find URLs in. Note: SVG images are XML documents.
+            binary_content = (mimetype_feature in _binary_mimetype_features
+                              and not (mimetype_feature == 'image' and 'svg' in self.mimetype))
+
+            if binary_content:
+                external_ressources: Dict[str, List[str]] = {ressource_type: [] for ressource_type in external_ressources_types}
+                embedded_ressources: Dict[str, List[Tuple[str, BytesIO]]] = {}
+            else:
+                external_ressources, embedded_ressources = find_external_ressources(body, self.name, all_requests)
             if 'rendered_html' in self.features:
-                rendered_external, rendered_embedded = find_external_ressources(self.rendered_html, self.name, all_requests)
+                rendered_external, rendered_embedded = find_external_ressources(self.rendered_html.getvalue(), self.name, all_requests)
                 # for the external ressources, the keys are always the same
                 external_ressources = {initiator_type: urls + rendered_external[initiator_type] for initiator_type, urls in external_ressources.items()}
 
@@ -272,13 +334,10 @@ class URLNode(HarTreeNode):
                 self.add_feature('filename', 'file.bin')
 
             # Common JS redirect we can catch easily
-            # NOTE: it is extremely fragile and doesn't work very often but is kinda better than nothing.
-            # Source: https://stackoverflow.com/questions/13363174/regular-expression-to-catch-as-many-javascript-redirections-as-possible
-            regex = re.compile(br"""((location.href)|(window.location)|(location.replace)|(location.assign))(( ?= ?)|( ?\( ?))("|')([^'"]*)("|')( ?\) ?)?;""", re.I)
-            matches = re.findall(regex, self.body.getvalue())
+            matches = _js_redirect_regex.findall(body) if not binary_content else []
             for match in matches:
                 # TODO: new type, redirect_js or something like that
-                redirect_url = rebuild_url(self.name, match[9].decode(), all_requests)
+                redirect_url = rebuild_url(self.name, match[9].decode(), all_requests, self.url_split)
                 if redirect_url in all_requests:
                     self.add_feature('redirect', True)
                     self.add_feature('redirect_url', redirect_url)
@@ -289,75 +348,44 @@ class URLNode(HarTreeNode):
                     self.add_feature('redirect', True)
                     self.add_feature('redirect_url', self.external_ressources['meta_refresh'][0])
 
-            if 'javascript' in self.mimetype or 'ecmascript' in self.mimetype:
-                self.add_feature('js', True)
-            elif self.mimetype.startswith('image'):
-                self.add_feature('image', True)
-            elif self.mimetype.startswith('text/css'):
-                self.add_feature('css', True)
-            elif 'json' in self.mimetype:
-                self.add_feature('json', True)
-            elif 'html' in self.mimetype:
-                self.add_feature('html', True)
-            elif 'font' in self.mimetype:
-                self.add_feature('font', True)
-            elif 'octet-stream' in self.mimetype:
-                self.add_feature('octet_stream', True)
-            elif ('text/plain' in self.mimetype or 'xml' in self.mimetype
-                    or 'application/x-www-form-urlencoded' in self.mimetype):
-                self.add_feature('text', True)
-            elif 'video' in self.mimetype:
-                self.add_feature('video', True)
-            elif 'audio' in self.mimetype:
-                self.add_feature('audio', True)
-            elif 'mpegurl' in self.mimetype.lower():
-                self.add_feature('livestream', True)
-            elif ('application/x-shockwave-flash' in self.mimetype
-                    or 'application/x-shockware-flash' in self.mimetype):  # Yes, shockwaRe
-                self.add_feature('flash', True)
-            elif 'application/pdf' in self.mimetype:
-                self.add_feature('pdf', True)
-            elif not self.mimetype:
-                self.add_feature('unset_mimetype', True)
-            else:
-                self.add_feature('unknown_mimetype', True)
-                self.logger.warning('Unknown mimetype: {}'.format(self.mimetype))
+            if mimetype_feature == 'unknown_mimetype':
+                self.logger.warning('Unknown mimetype: %s', self.mimetype)
+            self.add_feature(mimetype_feature, True)
 
         # NOTE: Chrome/Chromium only features
         if har_entry.get('serverIPAddress'):
             self.add_feature('ip_address', ipaddress.ip_address(har_entry['serverIPAddress']))
         if '_initiator' in har_entry:
-            if har_entry['_initiator']['type'] == 'other':
+            initiator = har_entry['_initiator']
+            if initiator['type'] == 'other':
                 pass
-            elif har_entry['_initiator']['type'] == 'parser' and har_entry['_initiator']['url']:
-                self.add_feature('initiator_url', unquote_plus(har_entry['_initiator']['url']))
-            elif har_entry['_initiator']['type'] == 'script':
-                url_stack = self._find_initiator_in_stack(har_entry['_initiator']['stack'])
+            elif initiator['type'] == 'parser' and initiator['url']:
+                self.add_feature('initiator_url', unquote_plus(initiator['url']))
+            elif initiator['type'] == 'script':
+                url_stack = self._find_initiator_in_stack(initiator['stack'])
                 if url_stack:
                     self.add_feature('initiator_url', url_stack)
-            elif har_entry['_initiator']['type'] == 'redirect':
+            elif initiator['type'] == 'redirect':
                 # FIXME: Need usecase
                 raise Exception(f'Got a redirect! - {har_entry}')
             else:
                 # FIXME: Need usecase
                 raise Exception(har_entry)
 
-        if har_entry['response']['redirectURL']:
+        original_redirect_url = response['redirectURL']
+        if original_redirect_url:
             self.add_feature('redirect', True)
-            redirect_url = har_entry['response']['redirectURL']
+            redirect_url = original_redirect_url
             # Rebuild the redirect URL so it matches the entry that sould be in all_requests
-            redirect_url = rebuild_url(self.name, redirect_url, all_requests)
+            redirect_url = rebuild_url(self.name, redirect_url, all_requests, self.url_split)
             # At this point, we should have a URL available in all_requests...
             if redirect_url in all_requests:
                 self.add_feature('redirect_url', redirect_url)
             else:
                 # ..... Or not. Unable to find a URL for this redirect
                 self.add_feature('redirect_to_nothing', True)
-                self.add_feature('redirect_url', har_entry['response']['redirectURL'])
-                self.logger.warning('Unable to find that URL: {original_url} - {original_redirect} - {modified_redirect}'.format(
-                    original_url=self.name,
-                    original_redirect=har_entry['response']['redirectURL'],
-                    modified_redirect=redirect_url))
+                self.add_feature('redirect_url', original_redirect_url)
+                self.logger.warning('Unable to find that URL: %s - %s - %s', self.name, original_redirect_url, redirect_url)
 
     def _find_initiator_in_stack(self, stack: MutableMapping[str, Any]) -> Optional[str]:
         # Because everything is terrible, and the call stack can have parents
@@ -403,31 +431,29 @@ class URLNode(HarTreeNode):
 
 class HostNode(HarTreeNode):
 
+    # Do not add the URLs in the json dump
+    features_to_skip = HarTreeNode.features_to_skip | {'urls'}
+
+    # Number of URL nodes loading each kind of content
+    _counters = ('js', 'redirect', 'redirect_to_nothing', 'image', 'css', 'json', 'html', 'font',
+                 'octet_stream', 'text', 'pdf', 'video', 'unset_mimetype', 'unknown_mimetype', 'iframe')
+    _flags = ('http_content', 'https_content', 'contains_rendered_urlnode')
+    # Features of the URL nodes incrementing each counter
+    _counted_url_features: Tuple[Tuple[str, Tuple[str, ...]], ...] = (
+        ('js', ('js',)), ('redirect', ('redirect',)), ('redirect_to_nothing', ('redirect_to_nothing',)),
+        ('image', ('image',)), ('css', ('css',)), ('json', ('json',)), ('html', ('html',)), ('font', ('font',)),
+        ('octet_stream', ('octet_stream',)), ('text', ('text',)),
+        ('pdf', ('pdf',)),  # FIXME: need icon
+        ('video', ('video', 'livestream', 'audio', 'flash')),
+        ('unknown_mimetype', ('unknown_mimetype', 'unset_mimetype')),
+        ('iframe', ('iframe',)))
+
     def __init__(self, capture_uuid: str, **kwargs: Any):
         """Node of the Hostname Tree"""
         super(HostNode, self).__init__(capture_uuid=capture_uuid, **kwargs)
-        # Do not add the URLs in the json dump
-        self.features_to_skip.add('urls')
-
         self.add_feature('urls', [])
-        self.add_feature('js', 0)
-        self.add_feature('redirect', 0)
-        self.add_feature('redirect_to_nothing', 0)
-        self.add_feature('image', 0)
-        self.add_feature('css', 0)
-        self.add_feature('json', 0)
-        self.add_feature('html', 0)
-        self.add_feature('font', 0)
-        self.add_feature('octet_stream', 0)
-        self.add_feature('text', 0)
-        self.add_feature('pdf', 0)
-        self.add_feature('video', 0)
-        self.add_feature('unset_mimetype', 0)
-        self.add_feature('unknown_mimetype', 0)
-        self.add_feature('iframe', 0)
-        self.add_feature('http_content', False)
-        self.add_feature('https_content', False)
-        self.add_feature('contains_rendered_urlnode', False)
+        self._add_features(dict.fromkeys(self._counters, 0))
+        self._add_features(dict.fromkeys(self._flags, False))
         self.cookies_sent: Set[str] = set()
         self.cookies_received: Set[Tuple[str, str, bool]] = set()
 
@@ -478,48 +504,25 @@ class HostNode(HarTreeNode):
         # Add to URLNode a reference to the HostNode UUID
         url.add_feature('hostnode_uuid', self.uuid)
 
-        if hasattr(url, 'rendered_html'):
+        if 'rendered_html' in url.features:
             self.contains_rendered_urlnode = True
 
-        if hasattr(url, 'cookies_sent'):
+        if 'cookies_sent' in url.features:
             # Keep a set of cookies sent: different URLs will send the same cookie
             self.cookies_sent.update(set(url.cookies_sent.keys()))
-        if hasattr(url, 'cookies_received'):
+        if 'cookies_received' in url.features:
             # Keep a set of cookies received: different URLs will receive the same cookie
             self.cookies_received.update({(domain, cookie, is_3rd_party)
                                           for domain, cookie, is_3rd_party in url.cookies_received})
-        if hasattr(url, 'js'):
-            self.js += 1
-        if hasattr(url, 'redirect'):
-            self.redirect += 1
-        if hasattr(url, 'redirect_to_nothing'):
-            self.redirect_to_nothing += 1
-        if hasattr(url, 'image'):
-            self.image += 1
-        if hasattr(url, 'css'):
-            self.css += 1
-        if hasattr(url, 'json'):
-            self.json += 1
-        if hasattr(url, 'html'):
-            self.html += 1
-        if hasattr(url, 'font'):
-            self.font += 1
-        if hasattr(url, 'octet_stream'):
-            self.octet_stream += 1
-        if hasattr(url, 'text'):
-            self.text += 1
-        if hasattr(url, 'pdf'):
-            self.pdf += 1  # FIXME: need icon
-        if hasattr(url, 'video') or hasattr(url, 'livestream') or hasattr(url, 'audio') or hasattr(url, 'flash'):
-            self.video += 1
-        if hasattr(url, 'unknown_mimetype') or hasattr(url, 'unset_mimetype'):
-            self.unknown_mimetype += 1
-        if hasattr(url, 'iframe'):
-            self.iframe += 1
-
-        if url.name.startswith('http://'):
+        url_features = url.features
+        for counter, counted_features in self._counted_url_features:
+            if not url_features.isdisjoint(counted_features):
+                setattr(self, counter, getattr(self, counter) + 1)
+
+        scheme = url.url_split.scheme
+        if scheme == 'http':
             self.http_content = True
-        elif url.name.startswith('https://'):
+        elif scheme == 'https':
             self.https_content = True
 
 
@@ -2,8 +2,9 @@
 # -*- coding: utf-8 -*-
 
 from pathlib import Path
-import copy
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from pickle import PicklingError
 from collections import defaultdict
 from typing import List, Dict, Optional, Iterable
 import logging
@@ -12,31 +13,80 @@ from .nodes import URLNode
 from .helper import Har2TreeError, Har2TreeLogAdapter
 
 
+def _load_harfile(har_path: Path, capture_uuid: str) -> Optional[Har2Tree]:
+    """Open a HAR file and build the trees, None if the file is not usable."""
+    try:
+        har2tree = Har2Tree(har_path, capture_uuid=capture_uuid)
+    except Har2TreeError:
+        return None
+    har2tree.make_tree()
+    return har2tree
+
+
+def _clone_url_node(node: URLNode, capture_uuid: str) -> URLNode:
+    """Copy a single URL node (without its children), the values of the features are shared with the original node."""
+    clone = URLNode(capture_uuid=capture_uuid)
+    for feature in node.features:
+        if feature == 'body' and not node.body_set_explicitly():
+            # Decoded from the response feature on access, no need to copy it
+            continue
+        setattr(clone, feature, getattr(node, feature))
+    clone.features = set(node.features)
+    return clone
+
+
+def _clone_url_tree(node: URLNode, capture_uuid: str) -> URLNode:
+    """Copy a URL tree: the nodes are new, the values of the features are shared with the original tree."""
+    # NOTE: iterative and not recursive, the trees can be deeper than the recursion limit.
+    root = _clone_url_node(node, capture_uuid)
+    to_process = [(node, root)]
+    while to_process:
+        original, clone = to_process.pop()
+        for child in original.children:
+            child_clone = clone.add_child(_clone_url_node(child, capture_uuid))
+            to_process.append((child, child_clone))
+    return root
+
+
 class CrawledTree(object):
 
-    def __init__(self, harfiles: Iterable[Path], uuid: str):
-        """ Convert a list of HAR files into a ETE Toolkit tree"""
+    def __init__(self, harfiles: Iterable[Path], uuid: str, max_workers: int=1):
+        """ Convert a list of HAR files into a ETE Toolkit tree
+
+        :param max_workers: number of processes building the trees of the HAR files in parallel, 1 (default) builds them in this process.
+                            The trees have to be pickled to get out of the workers: it is only faster on big HAR files,
+                            on the captures in tests/data it is slower than building them in this process.
+        """
         self.uuid = uuid
         logger = logging.getLogger(f'{__name__}.{self.__class__.__name__}')
         self.logger = Har2TreeLogAdapter(logger, {'uuid': uuid})
-        self.hartrees: List[Har2Tree] = self.load_all_harfiles(harfiles)
+        self.hartrees: List[Har2Tree] = self.load_all_harfiles(harfiles, max_workers)
         if not self.hartrees:
             raise Har2TreeError('No usable HAR files found.')
         self.root_hartree = self.hartrees.pop(0)
         self.find_parents()
         self.join_trees()
 
-    def load_all_harfiles(self, files: Iterable[Path]) -> List[Har2Tree]:
-        """Open all the HAR files and build the trees"""
-        loaded = []
-        for har_path in files:
-            try:
-                har2tree = Har2Tree(har_path, capture_uuid=self.uuid)
-            except Har2TreeError:
-                continue
-            har2tree.make_tree()
-            loaded.append(har2tree)
-        return loaded
+    def load_all_harfiles(self, files: Iterable[Path], max_workers: int=1) -> List[Har2Tree]:
+        """Open all the HAR files and build the trees.
+        With max_workers > 1, the trees are built in that many processes (see __init__).
+        """
+        files = list(files)
+        if max_workers > 1 and len(files) > 1:
+            # NOTE: the trees are independent until they're joined, but they have to be pickled to get out of the workers.
+            hartrees: List[Optional[Har2Tree]] = []
+            with ProcessPoolExecutor(max_workers=min(max_workers, len(files))) as executor:
+                futures = [executor.submit(_load_harfile, har_path, self.uuid) for har_path in files]
+                for har_path, future in zip(files, futures):
+                    try:
+                        hartrees.append(future.result())
+                    except (RecursionError, PicklingError):
+                        # Pickling a tree is recursive, it fails on the trees deeper than the recursion limit: build it here instead.
+                        self.logger.info(f'Unable to get the tree of {har_path} from the worker, building it in this process.')
+                        hartrees.append(_load_harfile(har_path, self.uuid))
+        else:
+            hartrees = [_load_harfile(har_path, self.uuid) for har_path in files]
+        return [har2tree for har2tree in hartrees if har2tree is not None]
 
     def find_parents(self) -> None:
         """Find all the trees where the first entry has a referer.
@@ -49,6 +99,8 @@ class CrawledTree(object):
 
     def join_trees(self, root: Optional[Har2Tree]=None, parent_root: Optional[URLNode]=None) -> None:
         """Connect the trees together if we have more than one HAR file"""
+        # The hostname tree is only built once all the trees are joined, in the initial call.
+        initial_call = root is None
         if root is None:
             root = self.root_hartree
             parent = root.url_tree
@@ -64,10 +116,11 @@ class CrawledTree(object):
             # No subtree to attach
             return
         for sub_tree in sub_trees:
-            to_attach = copy.deepcopy(sub_tree.url_tree)
+            to_attach = _clone_url_tree(sub_tree.url_tree, self.uuid)
             parent.add_child(to_attach)
             self.join_trees(sub_tree, to_attach)
-        self.root_hartree.make_hostname_tree(self.root_hartree.url_tree, self.root_hartree.hostname_tree)
+        if initial_call:
+            self.root_hartree.make_hostname_tree(self.root_hartree.url_tree, self.root_hartree.hostname_tree)
 
     def to_json(self) -> str:
         """JSON output for d3js"""
@@ -3,13 +3,15 @@
 
 import unittest
 from har2tree import CrawledTree
-from har2tree.helper import parse_data_uri, rebuild_url
+from har2tree.helper import parse_data_uri, rebuild_url, classify_mimetype, random_uuid
+from har2tree.har2tree import _load_json_file
 from pathlib import Path
 import datetime
 import os
 import uuid
 import json
 import cProfile
+import tempfile
 
 
 class SimpleTest(unittest.TestCase):
@@ -101,6 +103,37 @@ class SimpleTest(unittest.TestCase):
         # decodes base 64 into hello world; gives an idea of what the function does
         self.assertEqual(parse_data_uri("data:text/plain;charset=US-ASCII;base64,SGVsbG8sIFdvcmxkIQ=="), ('text/plain', 'charset=US-ASCII', b'Hello, World!'))
 
+    def test_random_uuid(self) -> None:
+        # The version and variant bits are set by hand, the UUIDs must still be valid random ones, in the same format as str(uuid.uuid4())
+        for _ in range(1000):
+            random_id = random_uuid()
+            parsed = uuid.UUID(random_id)
+            self.assertEqual(str(parsed), random_id)
+            self.assertEqual(parsed.version, 4)
+            self.assertEqual(parsed.variant, uuid.RFC_4122)
+
+    def test_load_json_file_fallback(self) -> None:
+        # orjson rejects lone surrogates and loads the integers above 64 bits as floats, both have to go through the json fallback
+        with tempfile.TemporaryDirectory() as tmpdir:
+            surrogate_file = Path(tmpdir) / 'surrogate.json'
+            surrogate_file.write_text('[{"name": "\\ud800", "value": "a"}]')
+            self.assertEqual(_load_json_file(surrogate_file), [{'name': '\ud800', 'value': 'a'}])
+            big_integer_file = Path(tmpdir) / 'big_integer.json'
+            big_integer_file.write_text('{"expires": 123456789012345678901234567890, "id": "uid:1234567890123456789012"}')
+            self.assertEqual(_load_json_file(big_integer_file), {'expires': 123456789012345678901234567890, 'id': 'uid:1234567890123456789012'})
+            both_file = Path(tmpdir) / 'both.json'
+            both_file.write_text('{"name": "\\ud800", "expires": [-98765432109876543210]}')
+            self.assertEqual(_load_json_file(both_file), {'name': '\ud800', 'expires': [-98765432109876543210]})
+
+    def test_classify_mimetype(self) -> None:
+        # The order of the checks matters: the first matching kind wins
+        self.assertEqual(classify_mimetype('application/javascript'), 'js')
+        self.assertEqual(classify_mimetype('image/svg+xml'), 'image')
+        self.assertEqual(classify_mimetype('application/xhtml+xml'), 'html')
+        self.assertEqual(classify_mimetype('application/vnd.apple.mpegURL'), 'livestream')
+        self.assertEqual(classify_mimetype(''), 'unset_mimetype')
+        self.assertEqual(classify_mimetype('application/grpc-web+proto'), 'unknown_mimetype')
+
     def test_rebuild_url_end_slash(self) -> None:
         # parser.py L#188 shows that rebuild_url should behave differently if there is a slash or not at the end of the base URL despite having same known urls;
         # see next two tests
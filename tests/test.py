@@ -2,8 +2,11 @@
 # -*- coding: utf-8 -*-
 
 import unittest
-from har2tree import CrawledTree
+from har2tree import CrawledTree, Har2Tree
 from pathlib import Path
+from io import BytesIO
+from base64 import b64decode
+import hashlib
 import os
 import uuid
 
@@ -18,12 +21,50 @@ class TestBasic(unittest.TestCase):
         crawled_tree = CrawledTree(har_to_process, str(uuid.uuid4()))
         crawled_tree.to_json()
 
+    def test_lalibre_max_workers(self) -> None:
+        test_dir = Path(os.path.abspath(os.path.dirname(__file__))) / 'data' / 'lalibre'
+        har_to_process = sorted(test_dir.glob('*.har'))
+        serial_tree = CrawledTree(har_to_process, str(uuid.uuid4()))
+        parallel_tree = CrawledTree(har_to_process, str(uuid.uuid4()), max_workers=2)
+        self.assertEqual(len(parallel_tree.hartrees), len(serial_tree.hartrees))
+        self.assertEqual([(node.name, len(node.children)) for node in parallel_tree.root_hartree.url_tree.traverse()],
+                         [(node.name, len(node.children)) for node in serial_tree.root_hartree.url_tree.traverse()])
+
     def test_wired(self) -> None:
         test_dir = Path(os.path.abspath(os.path.dirname(__file__))) / 'data' / 'wired'
         har_to_process: Iterable[Path] = sorted(test_dir.glob('*.har'))
         crawled_tree = CrawledTree(har_to_process, str(uuid.uuid4()))
         crawled_tree.to_json()
 
+    def test_url_node_body(self) -> None:
+        har_path = Path(os.path.abspath(os.path.dirname(__file__))) / 'data' / 'wired' / '0.har'
+        har2tree = Har2Tree(har_path, str(uuid.uuid4()))
+        har2tree.make_tree()
+        nodes = list(har2tree.url_tree.traverse())
+        empty_nodes = [node for node in nodes if node.empty_response]
+        nodes_with_body = [node for node in nodes if not node.empty_response]
+        self.assertTrue(empty_nodes)
+        self.assertTrue(nodes_with_body)
+        for node in empty_nodes:
+            self.assertFalse(hasattr(node, 'body'))
+        for node in nodes_with_body:
+            # The body is decoded from the HAR entry on access
+            self.assertFalse(node.body_set_explicitly())
+            content = node.response['content']
+            expected = b64decode(content['text']) if content.get('encoding') == 'base64' else content['text'].encode()
+            self.assertEqual(node.body.getvalue(), expected)
+            self.assertEqual(len(node.body.getvalue()), node.body_size)
+            self.assertEqual(hashlib.sha512(node.body.getvalue()).hexdigest(), node.body_hash)
+        # A body set explicitly is returned as is
+        node = nodes_with_body[0]
+        body = BytesIO(b'replaced body')
+        node.body = body
+        self.assertTrue(node.body_set_explicitly())
+        self.assertIs(node.body, body)
+        node = empty_nodes[0]
+        node.body = body
+        self.assertIs(node.body, body)
+
 
 if __name__ == '__main__':
     unittest.main()